@@ -0,0 +1,97 @@
+import numpy as np
+from numba import njit
+
+# Numba-compiled SHA-256 compression used by qsha.py when libcrypto cannot be
+# loaded. The rounds get compiled to native 32-bit shift/xor/add instructions
+# instead of interpreted bigint operations. Only imported when selected, since
+# importing numba is slow.
+
+# Blocks per message-schedule slab, bounding the (blocks, 64) array to 1 MiB
+_SCHEDULE_BLOCKS = 4096
+
+def _rotr_np(x, n):
+    """Rotate right on a uint32 array."""
+    return (x >> n) | (x << (32 - n))
+
+def _message_schedule_numpy(words):
+    """
+    Expands a (blocks, 16) uint32 array into the (blocks, 64) message schedule.
+    Each W[t] depends on earlier words of the same block only, so step t is
+    computed for every block at once with vectorized uint32 ufuncs.
+    """
+    # Work on a (64, blocks) layout so each step reads and writes contiguous rows
+    W = np.empty((64, words.shape[0]), dtype=np.uint32)
+    W[:16] = words.T
+    for t in range(16, 64):
+        x = W[t-15]
+        s0 = _rotr_np(x, 7) ^ _rotr_np(x, 18) ^ (x >> 3)
+        x = W[t-2]
+        s1 = _rotr_np(x, 17) ^ _rotr_np(x, 19) ^ (x >> 10)
+        W[t] = W[t-16] + s0 + W[t-7] + s1 # uint32 arithmetic wraps mod 2**32
+    return np.ascontiguousarray(W.T)
+
+@njit(cache=True)
+def _rotr32(x, n):
+    """Rotate right on a uint32; np.uint32() truncates Numba's widened result."""
+    return np.uint32((x >> n) | (x << (32 - n)))
+
+@njit(cache=True)
+def _compress_blocks_numba(state, schedule, k):
+    """Compresses every block of a precomputed (blocks, 64) message schedule into state."""
+    for block in range(schedule.shape[0]):
+        w = schedule[block]
+
+        # Unboxed uint32 working variables: Numba keeps them in registers, and
+        # wrapping an expression in np.uint32() is a plain 32-bit truncation,
+        # so no explicit & 0xFFFFFFFF masks are needed.
+        a = np.uint32(state[0])
+        b = np.uint32(state[1])
+        c = np.uint32(state[2])
+        d = np.uint32(state[3])
+        e = np.uint32(state[4])
+        f = np.uint32(state[5])
+        g = np.uint32(state[6])
+        h = np.uint32(state[7])
+        for t in range(64):
+            S1 = _rotr32(e, 6) ^ _rotr32(e, 11) ^ _rotr32(e, 25)
+            T1 = np.uint32(h + S1 + ((e & f) ^ (~e & g)) + k[t] + w[t])
+            S0 = _rotr32(a, 2) ^ _rotr32(a, 13) ^ _rotr32(a, 22)
+            T2 = np.uint32(S0 + ((a & b) ^ (a & c) ^ (b & c)))
+            h = g
+            g = f
+            f = e
+            e = np.uint32(d + T1)
+            d = c
+            c = b
+            b = a
+            a = np.uint32(T1 + T2)
+
+        # Storing into the uint32 state array wraps mod 2**32
+        state[0] += a
+        state[1] += b
+        state[2] += c
+        state[3] += d
+        state[4] += e
+        state[5] += f
+        state[6] += g
+        state[7] += h
+    return state
+
+def make_compress(round_constants):
+    """
+    Returns a compression function with the same contract as qsha._compress_python,
+    using round_constants (the 64 SHA-256 K values).
+    """
+    k = np.array(round_constants, dtype=np.uint32)
+
+    def _compress_numba(current_h, padded_message):
+        """Same contract as _compress_python, but runs the rounds in Numba-compiled code."""
+        state = np.array(current_h, dtype=np.uint32)
+        words = np.frombuffer(bytes(padded_message), dtype='>u4').astype(np.uint32).reshape(-1, 16)
+        for start in range(0, words.shape[0], _SCHEDULE_BLOCKS):
+            schedule = _message_schedule_numpy(words[start:start + _SCHEDULE_BLOCKS])
+            _compress_blocks_numba(state, schedule, k)
+        current_h[:] = state.tolist()
+        return current_h
+
+    return _compress_numba
@@ -1,13 +1,19 @@
 import os
 import math
 import logging
+import threading
 from qiskit import QuantumCircuit, transpile
-from qiskit_ibm_runtime import QiskitRuntimeService, Session, Sampler
+from qiskit_ibm_runtime import QiskitRuntimeService, Batch, SamplerV2 as Sampler
 from qiskit_aer import AerSimulator
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# QiskitRuntimeService shared by every QRBG instance, so only the first one
+# pays the authentication handshake
+_service_cache = None
+_service_lock = threading.Lock()
+
 class QuantumRandomBitGenerator:
     """
     Generates random bits using a real IBM Quantum backend.
@@ -22,6 +28,13 @@ class QuantumRandomBitGenerator:
         self.backend = None
         self.backend_name = None
         self.is_simulator = False # This class will not use simulators
+        self._transpiled_circuits = {} # Cached H+measure circuits keyed by (backend name, width)
+        self._transpile_lock = threading.Lock() # The background refill thread also uses the cache
+        self._pool = bytearray() # Reservoir of prefetched '0'/'1' bytes (see prefetch)
+        self._pool_lock = threading.Lock()
+        self._prefetch_bits = 0 # Size of the most recent prefetch, reused for refills
+        self._refill_threshold = 0 # Refill the pool in the background below this many bits (0 = never)
+        self._refill_thread = None
 
         self._initialize_ibm_quantum() # Directly attempt initialization
 
@@ -29,46 +42,36 @@ class QuantumRandomBitGenerator:
 
     def _initialize_ibm_quantum(self):
         """Initializes QiskitRuntimeService and selects a real backend."""
+        global _service_cache
         logging.info("Attempting to initialize Qiskit Runtime Service...")
-        API_TOKEN = os.environ.get("IBM_QUANTUM_TOKEN")
-        INSTANCE = os.environ.get("IBM_QUANTUM_INSTANCE") # e.g., 'ibm-q/open/main'
 
         try:
-            # Prefer loading from saved account first
-            try:
-                self.service = QiskitRuntimeService(channel='ibm_quantum')
-                logging.info("Loaded IBM Quantum credentials from saved account.")
-            except Exception:
-                logging.info("No saved IBM Quantum account found or error loading.")
-                if API_TOKEN and INSTANCE:
-                    self.service = QiskitRuntimeService(channel='ibm_quantum', token=API_TOKEN, instance=INSTANCE)
-                    logging.info("Initialized Qiskit Runtime Service using environment variables.")
-                elif API_TOKEN:
-                     # Attempt default instance if only token is provided (might work for some plans)
-                     logging.warning("IBM_QUANTUM_INSTANCE not set, attempting initialization without it.")
-                     self.service = QiskitRuntimeService(channel='ibm_quantum', token=API_TOKEN)
-                     logging.info("Initialized Qiskit Runtime Service using token (default instance).")
+            with _service_lock:
+                if _service_cache is None:
+                    _service_cache = self._create_service()
                 else:
-                    logging.warning("IBM_QUANTUM_TOKEN not found in environment variables.")
-                    raise ValueError("IBM Quantum API token not found.")
+                    logging.info("Reusing existing Qiskit Runtime Service.")
+                self.service = _service_cache
 
             logging.info("Qiskit Runtime Service initialized.")
 
             # Select the least busy backend that is operational and not a simulator
             logging.info("Searching for the least busy operational IBM Quantum backend...")
-            # Filter for operational, non-simulator backends supporting >= 1 qubit
-            backends = self.service.backends(simulator=False, operational=True, min_num_qubits=1)
-
-            if not backends:
-                logging.warning("No suitable operational IBM Quantum backends found.")
-                raise ConnectionError("No operational backends available.")
+            self.backend, pending_jobs = self._select_least_busy_backend()
 
-            # Sort by queue length (ascending)
-            backends.sort(key=lambda b: b.status().pending_jobs)
-            self.backend = backends[0] # Select the least busy
             self.backend_name = self.backend.name
             self.is_simulator = False
-            logging.info(f"Selected IBM Quantum backend: {self.backend_name} (Queue: {self.backend.status().pending_jobs})")
+            logging.info(f"Selected IBM Quantum backend: {self.backend_name} (Queue: {pending_jobs})")
+
+            # The circuit never changes, so transpile it once for the selected backend.
+            # Use the width a 256-bit salt request runs (see get_random_bits_wide).
+            # A failure here must not abort construction; it is retried on first use.
+            try:
+                width = min(len(self._usable_qubits()), 256)
+                if width > 0:
+                    self._get_transpiled_circuit(width)
+            except Exception as e:
+                logging.warning(f"Could not pre-transpile the wide random bit circuit ({e}); will transpile on first use.")
 
         except Exception as e:
             logging.error(f"Failed to initialize IBM Quantum Service or find backend: {e}")
@@ -76,6 +79,128 @@ class QuantumRandomBitGenerator:
             raise ConnectionError(f"Failed to initialize IBM Quantum Service or find suitable backend: {e}")
 
 
+    def _create_service(self):
+        """Creates a QiskitRuntimeService from saved credentials or environment variables."""
+        API_TOKEN = os.environ.get("IBM_QUANTUM_TOKEN")
+        INSTANCE = os.environ.get("IBM_QUANTUM_INSTANCE") # e.g., 'ibm-q/open/main'
+
+        # Prefer loading from saved account first
+        try:
+            service = QiskitRuntimeService(channel='ibm_quantum')
+            logging.info("Loaded IBM Quantum credentials from saved account.")
+        except Exception:
+            logging.info("No saved IBM Quantum account found or error loading.")
+            if API_TOKEN and INSTANCE:
+                service = QiskitRuntimeService(channel='ibm_quantum', token=API_TOKEN, instance=INSTANCE)
+                logging.info("Initialized Qiskit Runtime Service using environment variables.")
+            elif API_TOKEN:
+                 # Attempt default instance if only token is provided (might work for some plans)
+                 logging.warning("IBM_QUANTUM_INSTANCE not set, attempting initialization without it.")
+                 service = QiskitRuntimeService(channel='ibm_quantum', token=API_TOKEN)
+                 logging.info("Initialized Qiskit Runtime Service using token (default instance).")
+            else:
+                logging.warning("IBM_QUANTUM_TOKEN not found in environment variables.")
+                raise ValueError("IBM Quantum API token not found.")
+        return service
+
+    def _select_least_busy_backend(self):
+        """
+        Ranks the operational, non-simulator backends by queue length.
+
+        Each backend's status() is fetched exactly once and used for the
+        operational filter, the ranking and the log line. Neither
+        backends(operational=True) nor service.least_busy is used, because both
+        call status() per backend again on the client. Backends whose status
+        cannot be read are skipped.
+
+        Returns:
+            tuple: (backend, pending_jobs) for the least busy backend.
+        """
+        # Filter for non-simulator backends supporting >= 1 qubit (no status() calls needed)
+        backends = self.service.backends(simulator=False, min_num_qubits=1)
+
+        statuses = []
+        for backend in backends:
+            try:
+                status = backend.status()
+            except Exception as e:
+                logging.warning(f"Could not read status of {backend.name}: {e}")
+                continue
+            if status.operational:
+                statuses.append((backend, status.pending_jobs))
+
+        if not statuses:
+            logging.warning("No suitable operational IBM Quantum backends found.")
+            raise ConnectionError("No operational backends available.")
+
+        # Sort by queue length (ascending)
+        statuses.sort(key=lambda item: item[1])
+        return statuses[0]
+
+    def _usable_qubits(self):
+        """
+        Returns the physical qubits of the current backend that support measurement.
+        backend.num_qubits also counts faulty qubits, whose instructions
+        qiskit-ibm-runtime removes from backend.target, so wide circuits must avoid them.
+        """
+        qargs = self.backend.target.qargs_for_operation_name('measure')
+        if qargs is None:
+            # measure is defined globally, i.e. on every qubit
+            return list(range(self.backend.num_qubits))
+        return sorted(qarg[0] for qarg in qargs)
+
+    def _get_transpiled_circuit(self, width=1):
+        """
+        Returns a `width`-qubit H+measure circuit transpiled for the current backend.
+        Wide circuits are pinned to qubits that support measurement (see _usable_qubits);
+        the 1-qubit circuit is left to the transpiler's layout as before.
+        The result is cached per backend and width, so it is only built once.
+        """
+        key = (self.backend.name, width)
+        # Held across the transpile so a concurrent caller waits for this result
+        # instead of transpiling the same circuit again
+        with self._transpile_lock:
+            if key not in self._transpiled_circuits:
+                qc = QuantumCircuit(width, width)
+                qc.h(range(width))
+                qc.measure(range(width), range(width))
+                initial_layout = self._usable_qubits()[:width] if width > 1 else None
+                self._transpiled_circuits[key] = transpile(
+                    qc, self.backend, initial_layout=initial_layout, optimization_level=1
+                )
+                logging.info(f"Transpiled {width}-qubit random bit circuit for {self.backend.name}.")
+            return self._transpiled_circuits[key]
+
+    def _run_batch(self, circuit, total_shots):
+        """
+        Runs `circuit` for `total_shots` shots, split into jobs of at most
+        backend.max_shots that are all submitted within a single Batch.
+
+        Returns:
+            list: (PubResult, shots) pairs, one per submitted job, in order.
+        """
+        # Split the request into per-job shot partitions up front
+        max_shots_per_request = self.backend.max_shots
+        partitions = []
+        remaining_shots = total_shots
+        while remaining_shots > 0:
+            shots_to_run = min(remaining_shots, max_shots_per_request)
+            partitions.append(shots_to_run)
+            remaining_shots -= shots_to_run
+
+        # The jobs are independent, so submit them all within a single Batch
+        # instead of opening a new Session for every partition
+        with Batch(backend=self.backend) as batch:
+            sampler = Sampler(mode=batch)
+            jobs = []
+            for shots_to_run in partitions:
+                logging.info(f"Submitting job for {shots_to_run} shots...")
+                jobs.append(sampler.run([circuit], shots=shots_to_run))
+
+        # Collect the results once every job has been submitted
+        # Each job has a single circuit, so take the first PubResult
+        return [(job.result()[0], shots_to_run) for job, shots_to_run in zip(jobs, partitions)]
+
     def get_random_bits(self, num_bits):
         """
         Generates a specified number of random bits.
@@ -96,72 +221,37 @@ class QuantumRandomBitGenerator:
         if num_bits <= 0:
             return "", self.backend_name
 
-        logging.info(f"Generating {num_bits} random bits using {self.backend_name}...")
+        pooled_bits = self._take_from_pool(num_bits)
+        if pooled_bits is not None:
+            return pooled_bits, self.backend_name
 
-        # Create a simple 1-qubit circuit
-        qc = QuantumCircuit(1, 1)
-        qc.h(0)
-        qc.measure(0, 0)
+        return self._measure_single(num_bits)
 
-        bits = []
-        remaining_bits = num_bits
+    def _measure_single(self, num_bits):
+        """Runs the 1-qubit H+measure circuit for num_bits shots, bypassing the pool."""
+        logging.info(f"Generating {num_bits} random bits using {self.backend_name}...")
 
-        # Define maximum shots per job request based on the selected backend
-        max_shots_per_request = self.backend.max_shots
+        bits = []
 
         try:
-            # Transpile the single circuit once
-            transpiled_circuit = transpile(qc, self.backend)
-
-            while remaining_bits > 0:
-                shots_to_run = min(remaining_bits, max_shots_per_request)
-                logging.info(f"Requesting {shots_to_run} shots (remaining: {remaining_bits})...")
-
-                # Always run on the selected IBM Quantum backend
-                # Using backend.run (simpler for getting counts/memory than Sampler here)
-                with Session(self.backend) as session:
-                    sampler = Sampler()
-                    job = sampler.run([transpiled_circuit], shots=shots_to_run)
-                    result = job.result()
-                    # Access counts from the first PubResult's DataBin for V2 Sampler
-                    pub_result = result[0] # Get the result for the first circuit
-                    # Assuming the default classical register name is 'c' for QuantumCircuit(1,1)
-                    counts = pub_result.data.c.get_counts() # Access counts via the classical register attribute
-
-                # Sampler V2 might return integer keys {0: count0, 1: count1} or bitstrings '0', '1'
-                # .get() handles missing keys gracefully for either string or int.
-                # Let's try assuming string keys first as the original code did.
-                # If it fails, we might need to check for int keys: counts.get(0, 0)
-                count0 = counts.get('0', 0)
-                count1 = counts.get('1', 0)
-
-                # Create a list with the obtained bits based on counts
-                # Note: This loses the original sequence but preserves the distribution for this batch
-                current_bits = ['0'] * count0 + ['1'] * count1
-                # We should ideally shuffle these if sequence matters, but for hashing salt,
-                # the exact sequence might be less critical than the bit values themselves.
-                # Let's keep it simple for now.
-                bits.extend(current_bits[:shots_to_run]) # Ensure we don't add more than requested shots
-
-
-                remaining_bits -= shots_to_run
+            # Reuse the circuit transpiled for this backend across calls
+            transpiled_circuit = self._get_transpiled_circuit()
+
+            for pub_result, _ in self._run_batch(transpiled_circuit, num_bits):
+                # Assuming the default classical register name is 'c' for QuantumCircuit(1,1)
+                # get_bitstrings() returns the per-shot outcomes in order (the Sampler V2
+                # equivalent of memory=True), so no reconstruction from counts is needed
+                bits.extend(pub_result.data.c.get_bitstrings())
+
                 logging.info(f"Collected {len(bits)} bits so far.")
 
-            # Combine the collected bits
+            # Combine the collected bits in one pass
             bit_string = "".join(bits)
 
-            # Ensure we have exactly num_bits (might be slightly off due to counts method on real HW)
+            # Each job returns exactly one outcome per shot, so a short result means a job misbehaved
             if len(bit_string) != num_bits:
-                 logging.warning(f"Obtained bit string length {len(bit_string)} does not match requested {num_bits}. Using slice/padding.")
-                 # Pad with '0' or truncate as needed. Padding is less ideal for randomness.
-                 # Truncating is safer if we got too many. If too few, something went wrong.
-                 if len(bit_string) > num_bits:
-                     bit_string = bit_string[:num_bits]
-                 else:
-                     # This case indicates a problem, likely with the counts approach.
-                     logging.error(f"Generated fewer bits ({len(bit_string)}) than requested ({num_bits}). Aborting.")
-                     return None, self.backend_name
-
+                logging.error(f"Generated fewer bits ({len(bit_string)}) than requested ({num_bits}). Aborting.")
+                return None, self.backend_name
 
             logging.info(f"Successfully generated {num_bits} bits using {self.backend_name}.")
             return bit_string, self.backend_name
@@ -172,6 +262,120 @@ class QuantumRandomBitGenerator:
             return None, self.backend_name
 
 
+    def get_random_bits_wide(self, num_bits):
+        """
+        Generates random bits by measuring many qubits in parallel, so each shot
+        yields one bit per usable (non-faulty) qubit instead of one. A 256-bit request
+        on a 127-qubit backend needs ceil(256 / 127) = 3 shots rather than 256.
+
+        Args:
+            num_bits (int): The number of random bits to generate.
+
+        Returns:
+            tuple: Same as get_random_bits.
+        """
+        if self.backend is None:
+             logging.error("No backend available (failed to initialize IBM Quantum).")
+             return None, self.backend_name
+
+        if num_bits <= 0:
+            return "", self.backend_name
+
+        pooled_bits = self._take_from_pool(num_bits)
+        if pooled_bits is not None:
+            return pooled_bits, self.backend_name
+
+        return self._measure_wide(num_bits)
+
+    def _measure_wide(self, num_bits):
+        """Runs the wide H+measure circuit for num_bits bits, bypassing the pool."""
+        try:
+            width = min(len(self._usable_qubits()), num_bits)
+            if width == 0:
+                logging.error(f"No qubits on {self.backend_name} support measurement.")
+                return None, self.backend_name
+            shots = math.ceil(num_bits / width)
+            logging.info(f"Generating {num_bits} random bits using {shots} shot(s) of a {width}-qubit circuit on {self.backend_name}...")
+
+            try:
+                transpiled_circuit = self._get_transpiled_circuit(width)
+            except Exception as e:
+                logging.warning(f"Could not transpile the {width}-qubit random bit circuit ({e}); falling back to the 1-qubit circuit.")
+                return self._measure_single(num_bits)
+
+            # Every shot is a length-`width` bitstring; concatenate them in shot order
+            bit_string = "".join(
+                "".join(pub_result.data.c.get_bitstrings())
+                for pub_result, _ in self._run_batch(transpiled_circuit, shots)
+            )
+
+            if len(bit_string) < num_bits:
+                logging.error(f"Generated fewer bits ({len(bit_string)}) than requested ({num_bits}). Aborting.")
+                return None, self.backend_name
+
+            logging.info(f"Successfully generated {num_bits} bits using {self.backend_name}.")
+            return bit_string[:num_bits], self.backend_name
+
+        except Exception as e:
+            logging.exception(f"Error during quantum computation on {self.backend_name}: {e}")
+            return None, self.backend_name
+
+    def prefetch(self, num_bits, refill_threshold=None):
+        """
+        Fills the reservoir with num_bits bits so that later get_random_bits /
+        get_random_bits_wide calls can be served without a new QPU round-trip.
+        The queue and job overhead is then paid once per pool instead of once per hash.
+
+        Args:
+            num_bits (int): Number of bits to fetch (e.g. 1_000_000).
+            refill_threshold (int, optional): When the pool drops below this many
+                bits, another prefetch of the same size is started in a background
+                thread. 0 disables refills. If None, the current setting is kept.
+
+        Returns:
+            bool: True if the bits were added to the pool, False if generation failed.
+        """
+        if refill_threshold is not None:
+            self._refill_threshold = refill_threshold
+        self._prefetch_bits = num_bits
+
+        if self.backend is None or num_bits <= 0:
+            return False
+
+        logging.info(f"Prefetching {num_bits} random bits into the pool...")
+        bit_string, _ = self._measure_wide(num_bits)
+        if bit_string is None:
+            logging.error("Prefetch failed; pool left unchanged.")
+            return False
+
+        with self._pool_lock:
+            self._pool += bit_string.encode('ascii')
+            logging.info(f"Pool now holds {len(self._pool)} bits.")
+        return True
+
+    def _take_from_pool(self, num_bits):
+        """
+        Removes and returns num_bits bits from the pool as a string, or None if
+        the pool does not hold enough. Starts a background refill if needed.
+        """
+        with self._pool_lock:
+            if len(self._pool) < num_bits:
+                bits = None
+            else:
+                bits = self._pool[:num_bits].decode('ascii')
+                del self._pool[:num_bits]
+                logging.info(f"Served {num_bits} bits from the pool ({len(self._pool)} remaining).")
+
+            # Start at most one background refill at a time
+            needs_refill = len(self._pool) < self._refill_threshold and self._prefetch_bits > 0
+            if needs_refill and (self._refill_thread is None or not self._refill_thread.is_alive()):
+                self._refill_thread = threading.Thread(
+                    target=self.prefetch, args=(self._prefetch_bits,), daemon=True
+                )
+                self._refill_thread.start()
+        return bits
+
+
 # Example Usage (for testing - will now require IBM Q setup)
 if __name__ == "__main__":
     print("Testing QuantumRandomBitGenerator (Requires IBM Quantum Setup)...")
@@ -1,3 +1,4 @@
+import ctypes
 import hashlib
 import struct
 import math
@@ -6,6 +7,7 @@ from qrbg import QuantumRandomBitGenerator
 
 # Configure logging (can be configured externally as well)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
 
 # --- SHA-256 Constants and Helper Functions ---
 # (Adapted from Python's hashlib implementation reference or FIPS 180-4)
@@ -62,132 +64,370 @@ def Maj(x, y, z):
 
 # --- QSHA Implementation ---
 
-def _preprocess_message(message):
-    """Pads the message according to SHA-256 standards."""
-    message_len_bits = len(message) * 8
-    message += b'\x80' # Append '1' bit (represented as byte 0x80)
-    # Append '0' bits until message length in bits is congruent to 448 (mod 512)
-    message += b'\x00' * ((56 - (len(message) % 64)) % 64)
-    # Append original message length as 64-bit big-endian integer
-    message += struct.pack('>Q', message_len_bits)
-    return message
+def _preprocess_message(message, message_len_bits=None):
+    """
+    Pads the message according to SHA-256 standards.
+
+    message_len_bits is the length encoded in the padding. It defaults to the
+    length of `message`; the incremental hasher passes the total length hashed
+    when `message` is only the unprocessed tail.
+    """
+    message_len = len(message)
+    if message_len_bits is None:
+        message_len_bits = message_len * 8
+    # Append '1' bit (byte 0x80), then '0' bits until the length is congruent to 448 (mod 512),
+    # then the original message length in bits as a 64-bit big-endian integer.
+    # The final size is known up front, so build it in one preallocated buffer.
+    pad_len = (56 - (message_len + 1) % 64) % 64
+    total_len = message_len + 1 + pad_len + 8
+    buf = bytearray(total_len)
+    buf[:message_len] = message
+    buf[message_len] = 0x80
+    struct.pack_into('>Q', buf, total_len - 8, message_len_bits)
+    return bytes(buf)
 
 def _bits_to_ints(bit_string):
     """Converts a string of '0's and '1's into a list of 32-bit integers."""
-    ints = []
     chunk_size = 32
     if len(bit_string) % chunk_size != 0:
         raise ValueError("Bit string length must be a multiple of 32")
-    for i in range(0, len(bit_string), chunk_size):
-        chunk = bit_string[i:i+chunk_size]
-        ints.append(int(chunk, 2))
-    return ints
+    # int(..., 2) would also accept '_', whitespace and a sign, so check the characters first
+    if bit_string.strip('01'):
+        raise ValueError("Bit string must contain only '0' and '1'")
+    # Parse the whole string as one integer and unpack it into big-endian words
+    raw = int(bit_string, 2).to_bytes(len(bit_string) // 8, 'big') if bit_string else b''
+    return list(struct.unpack(f'>{len(bit_string) // chunk_size}L', raw))
+
+def _compress_python(current_h, padded_message):
+    """
+    Runs the SHA-256 compression function over every 64-byte block of the
+    padded message, updating current_h (a list of 8 32-bit ints) in place.
 
-def qsha256(input_data: bytes, qrbg_instance: QuantumRandomBitGenerator = None):
+    The rotr/Ch/Maj/sigma helpers are inlined and K[t] + w[t] is precomputed
+    per chunk, since global lookups and function calls dominate this loop.
     """
-    Computes the QSHA-256 hash of the input data using a real IBM Quantum backend.
+    M = 0xFFFFFFFF
+    K_local = K
+    debug = log.isEnabledFor(logging.DEBUG) # Checked once, not once per chunk
+    # iter_unpack yields each chunk's 16 big-endian 32-bit words without slicing the message
+    for chunk_index, chunk_words in enumerate(struct.iter_unpack('>16L', padded_message)):
+        w = list(chunk_words)
+        if debug:
+            log.debug("Processing chunk %d", chunk_index)
+
+        # Extend the 16 words into 64 words (message schedule)
+        for t in range(16, 64):
+            x = w[t-15]
+            s0 = ((x >> 7) | (x << 25)) ^ ((x >> 18) | (x << 14)) ^ (x >> 3)
+            x = w[t-2]
+            s1 = ((x >> 17) | (x << 15)) ^ ((x >> 19) | (x << 13)) ^ (x >> 10)
+            w.append((w[t-16] + s0 + w[t-7] + s1) & M)
+        kw = [(K_local[t] + w[t]) & M for t in range(64)]
+
+        # Initialize working variables for this chunk
+        a, b, c, d, e, f, g, h = current_h
+
+        # Compression function main loop (64 rounds)
+        for t in range(64):
+            S1 = ((e >> 6) | (e << 26)) ^ ((e >> 11) | (e << 21)) ^ ((e >> 25) | (e << 7))
+            T1 = (h + (S1 & M) + ((e & f) ^ (~e & g)) + kw[t]) & M
+            S0 = ((a >> 2) | (a << 30)) ^ ((a >> 13) | (a << 19)) ^ ((a >> 22) | (a << 10))
+            T2 = ((S0 & M) + ((a & b) ^ (a & c) ^ (b & c))) & M
+            h = g
+            g = f
+            f = e
+            e = (d + T1) & M
+            d = c
+            c = b
+            b = a
+            a = (T1 + T2) & M
+
+        # Update hash values for this chunk
+        current_h[0] = (current_h[0] + a) & M
+        current_h[1] = (current_h[1] + b) & M
+        current_h[2] = (current_h[2] + c) & M
+        current_h[3] = (current_h[3] + d) & M
+        current_h[4] = (current_h[4] + e) & M
+        current_h[5] = (current_h[5] + f) & M
+        current_h[6] = (current_h[6] + g) & M
+        current_h[7] = (current_h[7] + h) & M
+    return current_h
+
+
+# --- Native compression (OpenSSL) ---
+# hashlib cannot be seeded with a custom IV, but the salted initial hash values
+# can be loaded straight into OpenSSL's SHA256_CTX. SHA256_Update on a padded,
+# block-aligned message then runs OpenSSL's (SHA-NI/SIMD accelerated) block
+# function over every chunk without applying any padding of its own.
+
+class _SHA256_CTX(ctypes.Structure):
+    """Mirror of OpenSSL's SHA256_CTX (openssl/sha.h)."""
+    _fields_ = [
+        ("h", ctypes.c_uint32 * 8),
+        ("Nl", ctypes.c_uint32),
+        ("Nh", ctypes.c_uint32),
+        ("data", ctypes.c_uint32 * 16),
+        ("num", ctypes.c_uint32),
+        ("md_len", ctypes.c_uint32),
+    ]
+
+def _load_openssl_sha256_update():
+    """
+    Returns libcrypto's SHA256_Update, or None if it is unavailable or fails
+    a known-answer check against hashlib.
+
+    The symbol is looked up through the _hashlib extension module, which resolves
+    it from the exact libcrypto Python itself links. Searching for a system
+    libcrypto instead (ctypes.util.find_library) can pick macOS's unversioned
+    /usr/lib/libcrypto.dylib, which aborts the process when loaded.
+    """
+    try:
+        import _hashlib
+        func = ctypes.CDLL(_hashlib.__file__).SHA256_Update
+        func.argtypes = [ctypes.POINTER(_SHA256_CTX), ctypes.c_char_p, ctypes.c_size_t]
+        func.restype = ctypes.c_int
+
+        # With the standard IV the block function must reproduce plain SHA-256
+        probe = b"QSHA OpenSSL self-test"
+        ctx = _SHA256_CTX()
+        ctx.h[:] = H
+        padded_probe = _preprocess_message(probe)
+        func(ctypes.byref(ctx), padded_probe, len(padded_probe))
+        if struct.pack('>8L', *ctx.h) != hashlib.sha256(probe).digest():
+            raise ValueError("SHA256_Update known-answer check failed")
+        return func
+    except Exception as e:
+        log.debug("OpenSSL SHA-256 compression unavailable, falling back: %s", e)
+        return None
+
+_openssl_sha256_update = None # Resolved on first use by _select_compress
+
+def _compress_openssl(current_h, padded_message):
+    """Same contract as _compress_python, but runs the rounds inside libcrypto."""
+    ctx = _SHA256_CTX()
+    ctx.h[:] = current_h
+    _openssl_sha256_update(ctypes.byref(ctx), bytes(padded_message), len(padded_message))
+    current_h[:] = ctx.h
+    return current_h
+
+
+# --- JIT compression (Numba) ---
+# Used when libcrypto cannot be loaded. The kernel lives in _qsha_numba.py so that
+# numpy/numba are only imported when this fallback is actually selected.
+
+def _load_numba_compress():
+    """Returns the Numba-compiled compression, or None if numpy/numba are not installed."""
+    try:
+        import _qsha_numba
+    except ImportError as e:
+        log.debug("Numba SHA-256 compression unavailable, falling back: %s", e)
+        return None
+    return _qsha_numba.make_compress(K)
+
+def _select_compress():
+    """Picks the fastest available compression: OpenSSL, then Numba, then pure Python."""
+    global _openssl_sha256_update
+    _openssl_sha256_update = _load_openssl_sha256_update()
+    if _openssl_sha256_update is not None:
+        return _compress_openssl
+    return _load_numba_compress() or _compress_python
+
+_compress_impl = None # Chosen on the first hash rather than at import time
+
+def _compress(current_h, padded_message):
+    """Compresses padded_message into current_h with the selected implementation."""
+    global _compress_impl
+    if _compress_impl is None:
+        _compress_impl = _select_compress()
+        log.debug("Using %s for SHA-256 compression", _compress_impl.__name__)
+    return _compress_impl(current_h, padded_message)
+
+class QSHA256:
+    """
+    Incremental QSHA-256 hasher for a given 256-bit salt, with a hashlib-style
+    update()/hexdigest() interface. Data is compressed as soon as whole 64-byte
+    blocks are available, so arbitrarily long input streams use constant memory.
+    """
+    def __init__(self, salt_string):
+        """
+        Args:
+            salt_string (str): 256 random bits as a string of '0's and '1's.
+
+        Raises:
+            ValueError: If the salt string is not exactly 256 bits of '0'/'1'.
+        """
+        salt_ints = _bits_to_ints(salt_string)
+        if len(salt_ints) != 8:
+             # This should not happen if get_random_bits works correctly
+             raise ValueError(f"Salt conversion resulted in {len(salt_ints)} ints, expected 8.")
+
+        # Initialize hash values and apply salt
+        current_h = list(H) # Make a copy of initial values
+        debug = log.isEnabledFor(logging.DEBUG) # Skip building the hex lists unless they are logged
+        if debug:
+            log.debug("Initial H: %s", [hex(h) for h in current_h])
+            log.debug("Salt Integers: %s", [hex(s) for s in salt_ints])
+
+        for i in range(8):
+            current_h[i] = (current_h[i] ^ salt_ints[i]) & 0xFFFFFFFF
+        log.info("Applied quantum salt to initial hash values.")
+        if debug:
+            log.debug("Salted H: %s", [hex(h) for h in current_h])
+
+        self._h = current_h
+        self._buffer = bytearray() # Bytes not yet forming a whole 64-byte block
+        self._length = 0 # Total number of bytes passed to update()
+
+    def update(self, data):
+        """Feeds more message bytes into the hash."""
+        self._length += len(data)
+        if self._buffer:
+            self._buffer += data
+            data = self._buffer
+        full_len = len(data) - len(data) % 64
+        if full_len:
+            # Process message in 512-bit (64-byte) chunks
+            _compress(self._h, bytes(data[:full_len]))
+        self._buffer = bytearray(data[full_len:])
+
+    def hexdigest(self):
+        """Returns the 64-character hexadecimal digest of the data fed so far."""
+        # Pad the remaining tail with the total message length; the running state is left untouched
+        padded_tail = _preprocess_message(bytes(self._buffer), self._length * 8)
+        log.debug("Hashed %d bytes (%d-byte padded tail)", self._length, len(padded_tail))
+        final_h = _compress(list(self._h), padded_tail)
+        return ''.join(f'{val:08x}' for val in final_h)
+
+def _hash_with_salt(input_data, salt_string):
+    """
+    Computes the QSHA-256 digest of input_data for a given 256-bit salt string.
+
+    Raises:
+        ValueError: If the salt string is not exactly 256 bits of '0'/'1'.
+    """
+    hasher = QSHA256(salt_string)
+    hasher.update(input_data)
+    return hasher.hexdigest()
+
+def _get_qrbg(qrbg_instance):
+    """Returns qrbg_instance, or a new QuantumRandomBitGenerator if it is None."""
+    if qrbg_instance is None:
+        log.info("Creating new QuantumRandomBitGenerator instance for QSHA (requires IBM Q).")
+        return QuantumRandomBitGenerator()
+    return qrbg_instance
+
+def qsha256_hasher(qrbg_instance: QuantumRandomBitGenerator = None):
+    """
+    Fetches a fresh quantum salt and returns an incremental QSHA256 hasher for it,
+    for inputs that should be streamed rather than held in memory.
 
     Args:
-        input_data (bytes): The message to hash.
         qrbg_instance (QuantumRandomBitGenerator, optional): An existing QRBG instance.
             If None, a new one will be created (requires IBM Q setup).
 
     Returns:
         tuple: A tuple containing:
-            - str: The 64-character hexadecimal QSHA-256 digest.
+            - QSHA256: A hasher seeded with the new salt.
             - str: The name of the backend used for randomness generation.
-            Returns (None, backend_name) if hashing fails (e.g., QRBG error).
+            Returns (None, backend_name) if the salt could not be obtained.
     """
     # Create or use the QRBG instance. It will raise an error if IBM Q connection fails.
     try:
-        if qrbg_instance is None:
-            logging.info("Creating new QuantumRandomBitGenerator instance for QSHA (requires IBM Q).")
-            qrbg = QuantumRandomBitGenerator()
-        else:
-            qrbg = qrbg_instance
+        qrbg = _get_qrbg(qrbg_instance)
     except Exception as e:
-        logging.error(f"Failed to initialize QuantumRandomBitGenerator: {e}")
+        log.error(f"Failed to initialize QuantumRandomBitGenerator: {e}")
         return None, "Initialization Error" # Indicate failure reason
 
     # 1. Get Quantum Salt
     salt_bits = 256
-    logging.info(f"Requesting {salt_bits} bits for quantum salt...")
-    salt_string, backend_name = qrbg.get_random_bits(salt_bits)
+    log.info(f"Requesting {salt_bits} bits for quantum salt...")
+    # Measure many qubits per shot so the salt needs only a handful of shots
+    salt_string, backend_name = qrbg.get_random_bits_wide(salt_bits)
 
     if salt_string is None:
-        logging.error("Failed to obtain quantum salt from QRBG.")
+        log.error("Failed to obtain quantum salt from QRBG.")
         return None, backend_name # Propagate backend name even on failure
 
-    logging.info(f"Obtained {salt_bits}-bit salt from {backend_name}.")
-    # logging.debug(f"Salt: {salt_string}") # Optional: log the salt if needed
+    log.info(f"Obtained {salt_bits}-bit salt from {backend_name}.")
+    # log.debug("Salt: %s", salt_string) # Optional: log the salt if needed
 
     try:
-        salt_ints = _bits_to_ints(salt_string)
-        if len(salt_ints) != 8:
-             # This should not happen if get_random_bits works correctly
-             raise ValueError(f"Salt conversion resulted in {len(salt_ints)} ints, expected 8.")
+        return QSHA256(salt_string), backend_name
     except ValueError as e:
-        logging.error(f"Error processing salt string: {e}")
+        log.error(f"Error processing salt string: {e}")
         return None, backend_name
 
-    # 2. Initialize hash values and apply salt
-    current_h = list(H) # Make a copy of initial values
-    logging.debug(f"Initial H: {[hex(h) for h in current_h]}")
-    logging.debug(f"Salt Integers: {[hex(s) for s in salt_ints]}")
+def qsha256(input_data: bytes, qrbg_instance: QuantumRandomBitGenerator = None):
+    """
+    Computes the QSHA-256 hash of the input data using a real IBM Quantum backend.
 
-    for i in range(8):
-        current_h[i] = (current_h[i] ^ salt_ints[i]) & 0xFFFFFFFF
-    logging.info("Applied quantum salt to initial hash values.")
-    logging.debug(f"Salted H: {[hex(h) for h in current_h]}")
+    Args:
+        input_data (bytes): The message to hash.
+        qrbg_instance (QuantumRandomBitGenerator, optional): An existing QRBG instance.
+            If None, a new one will be created (requires IBM Q setup).
 
+    Returns:
+        tuple: A tuple containing:
+            - str: The 64-character hexadecimal QSHA-256 digest.
+            - str: The name of the backend used for randomness generation.
+            Returns (None, backend_name) if hashing fails (e.g., QRBG error).
+    """
+    hasher, backend_name = qsha256_hasher(qrbg_instance)
+    if hasher is None:
+        return None, backend_name
 
-    # 3. Preprocess the message
-    padded_message = _preprocess_message(input_data)
-    logging.debug(f"Padded message length: {len(padded_message)} bytes")
+    # Salted initial hash values are set up by the hasher; compress the message
+    hasher.update(input_data)
+    final_hash_hex = hasher.hexdigest()
+    log.info("QSHA-256 computation complete.")
 
-    # 4. Process message in 512-bit (64-byte) chunks
-    for i in range(0, len(padded_message), 64):
-        chunk = padded_message[i:i+64]
-        w = list(struct.unpack('>16L', chunk)) # Unpack chunk into 16 32-bit words (big-endian)
-        logging.debug(f"Processing chunk {i//64}")
+    return final_hash_hex, backend_name
 
-        # Extend the 16 words into 64 words (message schedule)
-        for t in range(16, 64):
-            s0 = Sigma0(w[t-15])
-            s1 = Sigma1(w[t-2])
-            w.append((w[t-16] + s0 + w[t-7] + s1) & 0xFFFFFFFF)
+def qsha256_many(inputs, qrbg_instance: QuantumRandomBitGenerator = None):
+    """
+    Computes QSHA-256 digests for several messages, each with its own fresh salt.
+    The salts for all messages are requested from the QRBG in one go, so the
+    IBM Quantum queue and job overhead is paid once rather than per message.
 
-        # Initialize working variables for this chunk
-        a, b, c, d, e, f, g, h = current_h
+    Args:
+        inputs (list[bytes]): The messages to hash.
+        qrbg_instance (QuantumRandomBitGenerator, optional): An existing QRBG instance.
+            If None, a new one will be created (requires IBM Q setup).
 
-        # Compression function main loop (64 rounds)
-        for t in range(64):
-            T1 = (h + sigma1(e) + Ch(e, f, g) + K[t] + w[t]) & 0xFFFFFFFF
-            T2 = (sigma0(a) + Maj(a, b, c)) & 0xFFFFFFFF
-            h = g
-            g = f
-            f = e
-            e = (d + T1) & 0xFFFFFFFF
-            d = c
-            c = b
-            b = a
-            a = (T1 + T2) & 0xFFFFFFFF
+    Returns:
+        tuple: A tuple containing:
+            - list[str]: One 64-character hexadecimal digest per input, in order.
+            - str: The name of the backend used for randomness generation.
+            Returns (None, backend_name) if hashing fails (e.g., QRBG error).
+    """
+    try:
+        qrbg = _get_qrbg(qrbg_instance)
+    except Exception as e:
+        log.error(f"Failed to initialize QuantumRandomBitGenerator: {e}")
+        return None, "Initialization Error"
 
-        # Update hash values for this chunk
-        current_h[0] = (current_h[0] + a) & 0xFFFFFFFF
-        current_h[1] = (current_h[1] + b) & 0xFFFFFFFF
-        current_h[2] = (current_h[2] + c) & 0xFFFFFFFF
-        current_h[3] = (current_h[3] + d) & 0xFFFFFFFF
-        current_h[4] = (current_h[4] + e) & 0xFFFFFFFF
-        current_h[5] = (current_h[5] + f) & 0xFFFFFFFF
-        current_h[6] = (current_h[6] + g) & 0xFFFFFFFF
-        current_h[7] = (current_h[7] + h) & 0xFFFFFFFF
-
-    # 5. Produce final hash value
-    final_hash_hex = ''.join(f'{val:08x}' for val in current_h)
-    logging.info("QSHA-256 computation complete.")
+    salt_bits = 256
+    total_bits = salt_bits * len(inputs)
+    log.info(f"Requesting {total_bits} bits for {len(inputs)} quantum salts...")
+    pool, backend_name = qrbg.get_random_bits_wide(total_bits)
 
-    return final_hash_hex, backend_name
+    if pool is None:
+        log.error("Failed to obtain quantum salts from QRBG.")
+        return None, backend_name
+
+    log.info(f"Obtained {len(inputs)} {salt_bits}-bit salts from {backend_name}.")
+
+    try:
+        digests = [
+            _hash_with_salt(input_data, pool[i * salt_bits:(i + 1) * salt_bits])
+            for i, input_data in enumerate(inputs)
+        ]
+    except ValueError as e:
+        log.error(f"Error processing salt string: {e}")
+        return None, backend_name
+    log.info(f"QSHA-256 computation complete for {len(inputs)} messages.")
+
+    return digests, backend_name
 
 
 # Example Usage (for testing)
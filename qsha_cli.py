@@ -11,7 +11,7 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, script_dir)
 
 try:
-    from qsha import qsha256
+    from qsha import qsha256_hasher, qsha256_many
     from qrbg import QuantumRandomBitGenerator # Although qsha handles instance creation
 except ImportError as e:
     print(f"Error: Failed to import required modules (qsha, qrbg). Ensure they are in the same directory or Python path: {e}", file=sys.stderr)
@@ -38,6 +38,12 @@ def main():
         default=256,
         help="Desired hash length in bits. Currently only 256 is supported. (Default: 256)"
     )
+    parser.add_argument(
+        '--batch',
+        metavar='FILE',
+        help="Hash every line of FILE as a separate message, printing one digest per line. "
+             "All salts are fetched from IBM Quantum in a single batch."
+    )
     # Removed --simulator argument
     parser.add_argument(
         '-v', '--verbose',
@@ -62,33 +68,42 @@ def main():
         print(f"Error: Currently, only --bits 256 is supported by the QSHA implementation.", file=sys.stderr)
         sys.exit(1)
 
-    # --- Get Input Message ---
+    if args.batch is not None and args.message is not None:
+        print("Error: Provide either a message or --batch FILE, not both.", file=sys.stderr)
+        sys.exit(1)
+
+    # --- Batch Mode ---
+    if args.batch is not None:
+        sys.exit(run_batch(args))
+
+    # --- Encode Message Argument ---
+    input_bytes = None
     if args.message is not None:
-        input_string = args.message
+        try:
+            input_bytes = args.message.encode('utf-8')
+        except Exception as e:
+             print(f"Error encoding input message to UTF-8: {e}", file=sys.stderr)
+             sys.exit(1)
         logging.info("Read message from command line argument.")
-    else:
-        if sys.stdin.isatty():
-            print("Enter message (end with Ctrl+D on Unix/Linux, Ctrl+Z+Enter on Windows):", file=sys.stderr)
-        input_string = sys.stdin.read()
-        logging.info("Read message from standard input.")
-        # Remove trailing newline often added by echo or interactive input
-        if input_string.endswith('\n'):
-            input_string = input_string[:-1]
 
-
-    # Ensure message is bytes
-    try:
-        input_bytes = input_string.encode('utf-8')
-    except Exception as e:
-         print(f"Error encoding input message to UTF-8: {e}", file=sys.stderr)
-         sys.exit(1)
+    # Prompt before the salt request, which can wait in the IBM Quantum queue
+    if input_bytes is None and sys.stdin.isatty():
+        print("Enter message (end with Ctrl+D on Unix/Linux, Ctrl+Z+Enter on Windows):", file=sys.stderr)
 
     # --- Compute QSHA Hash ---
     print(f"Computing QSHA-{args.bits} hash using IBM Quantum...", file=sys.stderr)
-    # qsha256 will now handle QRBG creation, which requires IBM Q connection.
+    # qsha256_hasher handles QRBG creation, which requires IBM Q connection.
     # We wrap this in a try-except block to catch potential initialization or runtime errors.
     try:
-        digest, source = qsha256(input_bytes) # No force_simulator needed
+        hasher, source = qsha256_hasher()
+
+        digest = None
+        if hasher is not None:
+            if input_bytes is not None:
+                hasher.update(input_bytes)
+            else:
+                stream_stdin(hasher)
+            digest = hasher.hexdigest()
 
         # --- Output Results ---
         if digest:
@@ -109,6 +124,54 @@ def main():
         print(f"Details: {e}", file=sys.stderr)
         sys.exit(1)
 
+def stream_stdin(hasher, chunk_size=65536):
+    """
+    Feeds standard input into hasher in chunk_size reads instead of reading it all
+    into memory. A single trailing newline (often added by echo or interactive
+    input) is not hashed.
+    """
+    # Read in text mode so newlines are translated (\r\n -> \n) exactly as
+    # sys.stdin.read() did, then encode each chunk to UTF-8.
+    # Hold back a chunk's final newline until we know whether more input follows.
+    held_newline = False
+    for chunk in iter(lambda: sys.stdin.read(chunk_size), ''):
+        if held_newline:
+            hasher.update(b'\n')
+        held_newline = chunk.endswith('\n')
+        hasher.update((chunk[:-1] if held_newline else chunk).encode('utf-8'))
+    logging.info("Read message from standard input.")
+
+def run_batch(args):
+    """Hashes each line of args.batch and returns the process exit code."""
+    try:
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            # Iterate lines rather than splitlines(), which also splits on \x0c, \x85, \u2028, etc.
+            messages = [line.rstrip('\n').encode('utf-8') for line in f]
+        logging.info(f"Read {len(messages)} messages from {args.batch}.")
+    except (OSError, UnicodeError) as e:
+        print(f"Error reading batch file {args.batch}: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Computing QSHA-{args.bits} hashes for {len(messages)} messages using IBM Quantum...", file=sys.stderr)
+    try:
+        digests, source = qsha256_many(messages)
+
+        if digests is not None:
+            for digest in digests:
+                print(digest, file=sys.stdout)
+            print(f"Randomness Source: {source}", file=sys.stderr)
+            return 0
+        else:
+            print(f"Error: Failed to compute QSHA hashes. Check logs for details.", file=sys.stderr)
+            print(f"Last known source attempt: {source}", file=sys.stderr)
+            return 1
+
+    except Exception as e:
+        print(f"\nError: An exception occurred during QSHA processing.", file=sys.stderr)
+        print(f"Ensure IBM Quantum credentials are correctly configured (see README.md).", file=sys.stderr)
+        print(f"Details: {e}", file=sys.stderr)
+        return 1
+
 # Keep only one correctly placed main execution block
 if __name__ == "__main__":
     main()